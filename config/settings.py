@@ -10,7 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +49,27 @@ INSTALLED_APPS = [
     'users',
 ]
 
+# Which part of the project this process serves (set with the `DJANGO_ROLE` environment variable), each role only
+# loads the apps it needs, see `python manage.py startup_profile` for the startup time and memory of each role:
+#   all:    everything, used in development (default)
+#   api:    the REST API, without the admin and the OpenAPI schema/swagger stack (DRF itself still imports parts of
+#           `django.contrib.admin` through `rest_framework.schemas`, so it saves less than the other roles)
+#   admin:  the django admin, without the OpenAPI schema/swagger stack
+#   worker: management commands and background jobs (e.g. sending emails), it doesn't serve the admin nor the schema
+ROLE = os.environ.get('DJANGO_ROLE', 'all')
+
+ROLE_EXCLUDED_APPS = {
+    'all': [],
+    'api': ['django.contrib.admin', 'drf_spectacular'],
+    'admin': ['drf_spectacular'],
+    'worker': ['django.contrib.admin', 'django.contrib.staticfiles', 'drf_spectacular'],
+}
+
+if ROLE not in ROLE_EXCLUDED_APPS:
+    raise ImproperlyConfigured(f'DJANGO_ROLE must be one of {", ".join(ROLE_EXCLUDED_APPS)}, not {ROLE!r}')
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in ROLE_EXCLUDED_APPS[ROLE]]
+
 REST_FRAMEWORK = {
     # Use Django's standard `django.contrib.auth` permissions,
     # or allow read-only access for unauthenticated users.
@@ -55,7 +79,7 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.TokenAuthentication',
     ],
 }
 
@@ -71,6 +95,10 @@ SPECTACULAR_SETTINGS = {
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+
+    # caches `User`/`Token` lookups for the duration of a request, see `users/identity_map.py`
+    'users.middleware.IdentityMapMiddleware',
+
     'django.contrib.sessions.middleware.SessionMiddleware',
 
     # it takes site default language as your browser's language
@@ -122,9 +150,31 @@ DATABASES = {
         'HOST': 'db',  # used in docker
         # 'HOST': 'localhost', # used in local
         'PORT': 5432,
+
+        # keep connections open between requests, workers of `manage.py serve` open them before accepting traffic
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Connections the web server may hold open to each database. With `CONN_MAX_AGE` every thread that serves requests
+# keeps its own connection, so `manage.py serve` caps workers * threads to this budget. Keep it below the
+# `max_connections` of the server (100 for the `postgres` image of docker-compose) minus what migrations, shells and
+# other hosts need.
+DATABASE_CONNECTION_BUDGET = int(os.environ.get('DATABASE_CONNECTION_BUDGET', 80))
+
+# `manage.py test` gets three local SQLite databases, used as shards by the sharding tests (`users/tests.py`), the
+# test runner creates them in memory
+if sys.argv[1:2] == ['test']:
+    DATABASES.update({f'users_{i}': {'ENGINE': 'django.db.backends.sqlite3'} for i in range(3)})
+
+# Hash-based sharding of users and their tokens, list the database aliases that hold them, see `users/sharding.py`
+USER_SHARDS = []
+
+DATABASE_ROUTERS = ['users.sharding.ShardRouter']
+
+AUTHENTICATION_BACKENDS = ['users.backends.ModelBackend']
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -171,5 +221,11 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.User'
+
+# Authentication event log, see `users/auth_log.py`
+AUTH_LOG_DIR = BASE_DIR / 'logs' / 'auth'
+AUTH_LOG_BATCH_SIZE = 256  # events buffered in a process before they are written
+AUTH_LOG_FLUSH_INTERVAL = 5  # seconds between two writes of the buffer, at most that many seconds of events are lost
+AUTH_LOG_MAX_BYTES = 64 * 1024 * 1024  # size of a log file before a new one is started
 DEFAULT_FROM_EMAIL = 'noreply@pysell.ir'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
@@ -13,25 +13,40 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include
 
 from django.conf import settings
 from django.conf.urls.static import static
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
-urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('users/', include('users.urls')),
+# the admin and the drf-spectacular views are imported only by the roles that serve them (see `ROLE` in settings)
+urlpatterns = []
 
-    # to show a login button in a django rest framework navbar, you must set this route, and add a
-    # `DEFAULT_AUTHENTICATION_CLASSES` config in setting file.
-    path('api-auth/', include('rest_framework.urls')),
+if settings.ROLE in ('all', 'admin'):
+    from django.contrib import admin
+
+    urlpatterns += [
+        path('admin/', admin.site.urls),
+    ]
+
+if settings.ROLE in ('all', 'api', 'worker'):
+    urlpatterns += [
+        path('users/', include('users.urls')),
+
+        # to show a login button in a django rest framework navbar, you must set this route, and add a
+        # `DEFAULT_AUTHENTICATION_CLASSES` config in setting file.
+        path('api-auth/', include('rest_framework.urls')),
+
+        # path('products/', include('products.urls')),
+    ]
+
+if settings.ROLE == 'all':
+    from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
+
+    urlpatterns += [
+        path("api/schema/", SpectacularAPIView.as_view(), name="schema"),  # need to generate swagger-ui
+        path("", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
+        # path("api/schema/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc", ),
+    ]
 
-    # path('products/', include('products.urls')),
-    path("api/schema/", SpectacularAPIView.as_view(), name="schema"),  # need to generate swagger-ui
-    path("", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
-    # path("api/schema/redoc/", SpectacularRedocView.as_view(url_name="schema"), name="redoc", ),
-]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)  # allows us to access media by url
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
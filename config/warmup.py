@@ -0,0 +1,104 @@
+"""
+Startup warmup for production workers.
+
+Everything that Django, DRF and drf-spectacular would otherwise do lazily on the first request (importing views,
+building URL resolvers, generating the OpenAPI schema, loading password hashers) is done here once, in the master
+process, before the workers are forked. The forked workers share those pages with the master copy-on-write.
+
+Database connections are the exception: a socket must never be shared between processes, so `warm_connections()` is
+called in each worker after the fork.
+"""
+import gc
+import os
+import resource
+import sys
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers, get_hashers_by_algorithm
+from django.db import connections
+from django.urls import get_resolver
+
+
+def warm_url_resolvers():
+    """
+    Populate the root resolver (and every included resolver) so the first `resolve()`/`reverse()` of a worker does not
+    have to import the view modules and compile the URL patterns.
+    """
+    resolver = get_resolver()
+    resolver.reverse_dict  # noqa: B018, populates the reverse lookup tables of all included url confs
+    return len(resolver.url_patterns)
+
+
+def warm_schema():
+    """
+    Generate the OpenAPI schema once, this imports `drf_spectacular`, inspects every serializer and caches the
+    serializer fields on the classes. Roles that don't serve the schema don't install `drf_spectacular`, and skip it.
+    """
+    if not apps.is_installed('drf_spectacular'):
+        return
+
+    from drf_spectacular.generators import SchemaGenerator
+
+    SchemaGenerator().get_schema(request=None, public=True)
+
+
+def warm_password_hashers():
+    """
+    `get_hashers()` imports the hasher classes of `PASSWORD_HASHERS` lazily and caches them, the first signin of a
+    worker would otherwise pay for those imports.
+    """
+    get_hashers_by_algorithm()
+    return len(get_hashers())
+
+
+def warm_connections():
+    """
+    Open one connection per database in use, `default` and the user shards. Must be called after the fork, in the
+    thread of the worker that serves the requests.
+    """
+    for alias in dict.fromkeys(['default', *settings.USER_SHARDS]):
+        connections[alias].ensure_connection()
+
+
+def close_connections():
+    """
+    Close every connection the master opened while warming up, so that no socket is inherited by the workers.
+    """
+    for connection in connections.all():
+        connection.close()
+
+
+def current_rss():
+    """
+    Return the resident set size of the current process in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # `ru_maxrss` is the peak rss, in kilobytes on linux and in bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def warmup(schema=True):
+    """
+    Run every pre-fork warmup step and return the time spent in seconds.
+
+    Garbage collection is frozen at the end: objects allocated so far are moved to a permanent generation, so the
+    collector of a forked worker never touches (and therefore never copies) their pages.
+    """
+    started = time.perf_counter()
+
+    warm_url_resolvers()
+    if schema:
+        warm_schema()
+    warm_password_hashers()
+    close_connections()
+
+    gc.collect()
+    gc.freeze()
+
+    return time.perf_counter() - started
@@ -0,0 +1,140 @@
+"""
+Append-only log of authentication events (signins, failed signins, signups, password resets, password and email
+changes).
+
+Writing an audit row per request would add a synchronous database write to the hottest endpoints, so events are
+instead appended, as compact NDJSON lines, to an in-memory buffer of the process. The buffer is written to a local file
+in one `write()` when it holds `AUTH_LOG_BATCH_SIZE` events, every `AUTH_LOG_FLUSH_INTERVAL` seconds (by a daemon
+thread, started in each process on its first event) and when the process exits. Events still buffered when a process
+is killed, at most `AUTH_LOG_FLUSH_INTERVAL` seconds of them, are lost.
+
+Every process writes its own files, `auth-<date>-<pid>-<n>.ndjson` in `AUTH_LOG_DIR`, a new file is started every day
+and when the current one reaches `AUTH_LOG_MAX_BYTES`, so writers never share a file. Use
+`python manage.py auth_log` to query them.
+
+A record looks like this (`t`: unix time, `e`: event, `u`: user id, `ip`: client address):
+    {"t":1681210000.123,"e":"signin","u":42,"email":"john@example.com","ip":"10.0.0.7"}
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import User
+
+SIGNIN = 'signin'
+SIGNIN_FAILED = 'signin_failed'
+SIGNUP = 'signup'
+SIGNUP_CONFIRM = 'signup_confirm'
+PASSWORD_RESET = 'password_reset'
+PASSWORD_RESET_CONFIRM = 'password_reset_confirm'
+PASSWORD_CHANGE = 'password_change'
+EMAIL_CHANGE = 'email_change'
+
+EVENTS = (
+    SIGNIN, SIGNIN_FAILED, SIGNUP, SIGNUP_CONFIRM, PASSWORD_RESET, PASSWORD_RESET_CONFIRM, PASSWORD_CHANGE,
+    EMAIL_CHANGE,
+)
+
+
+class AuthEventLog:
+    def __init__(self, directory, batch_size=256, flush_interval=5.0, max_bytes=64 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._path = None
+        self._size = 0
+        self._flusher_pid = None
+
+    def append(self, event, user_id=None, email=None, ip=None):
+        record = {'t': round(time.time(), 3), 'e': event, 'u': user_id, 'email': email, 'ip': ip}
+        line = json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+        with self._lock:
+            # threads don't survive a fork, a worker starts its own flusher
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_periodically, name='auth-log-flusher', daemon=True).start()
+
+            self._buffer.append(line)
+            if len(self._buffer) >= self.batch_size:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+
+        data = ''.join(self._buffer).encode()
+        path = self._current_path(len(data))
+        with open(path, 'ab') as file:
+            file.write(data)
+
+        self._size += len(data)
+        self._buffer.clear()
+
+    def _current_path(self, incoming):
+        """
+        Return the file to append `incoming` bytes to, starting a new one on a new day, in a new process (after a fork
+        the child must not append to the file of its parent) or when the current one is full.
+        """
+        prefix = f'auth-{time.strftime("%Y%m%d")}-{os.getpid()}-'
+        if self._path is not None and self._path.name.startswith(prefix) and self._size + incoming <= self.max_bytes:
+            return self._path
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        sequence = 0
+        if self._path is not None and self._path.name.startswith(prefix):
+            sequence = int(self._path.stem.rsplit('-', 1)[1]) + 1
+
+        while True:
+            self._path = self.directory / f'{prefix}{sequence}.ndjson'
+            self._size = self._path.stat().st_size if self._path.exists() else 0
+            if self._size == 0 or self._size + incoming <= self.max_bytes:
+                return self._path
+            sequence += 1
+
+
+def iter_files(directory):
+    return sorted(Path(directory).glob('auth-*.ndjson'))
+
+
+log = AuthEventLog(
+    directory=settings.AUTH_LOG_DIR,
+    batch_size=settings.AUTH_LOG_BATCH_SIZE,
+    flush_interval=settings.AUTH_LOG_FLUSH_INTERVAL,
+    max_bytes=settings.AUTH_LOG_MAX_BYTES,
+)
+atexit.register(log.flush)
+
+
+def record(event, request, user=None, email=None):
+    """
+    Log an authentication event of `request`, for `user` when it is known, otherwise for the `email` that was used.
+    `email` may come straight from the request body, it's only logged when it's a string, cut to the size of an email.
+    """
+    if user is None:
+        email = email[:User._meta.get_field('email').max_length] if isinstance(email, str) else None
+
+    log.append(
+        event,
+        user_id=user.pk if user is not None else None,
+        email=user.email if user is not None else email,
+        ip=request.META.get('REMOTE_ADDR'),
+    )
@@ -0,0 +1,23 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import authentication, exceptions
+from rest_framework.authtoken.models import Token
+
+from . import identity_map
+
+
+class TokenAuthentication(authentication.TokenAuthentication):
+    """
+    DRF's `TokenAuthentication`, but the token and its user are loaded through the request identity map, so the views
+    get the same `request.user` instance the rest of the request works with.
+    """
+
+    def authenticate_credentials(self, key):
+        try:
+            token = identity_map.get_token(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return token.user, token
@@ -0,0 +1,18 @@
+from django.contrib.auth import backends
+
+from . import sharding
+from .models import User
+
+
+class ModelBackend(backends.ModelBackend):
+    """
+    Django's `ModelBackend`, except that users are loaded by id from whichever shard holds them (sessions, admin), see
+    `users/sharding.py`. Authentication by email is routed by `UserManager.get_by_natural_key()`.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = sharding.get_user(user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,153 @@
+"""
+A request-scoped identity map for `User` and `Token` rows.
+
+Within one request the same user or token is often needed several times (a serializer validates it, the view loads
+it again, `token.user` is loaded lazily, ...). While a map is active (`IdentityMapMiddleware` activates one for every
+request) each row is loaded at most once, every later lookup by pk, email or key returns the same instance and costs
+zero queries. The map is dropped at the end of the request, so nothing is shared between requests.
+
+The map is kept coherent by the `post_save` / `post_delete` receivers in `users.signals`, token deletes go through
+`delete_tokens()` (a `post_delete` receiver on `Token` would turn every queryset delete into a select + delete).
+
+Outside a request (management commands, shell, ...) no map is active and every lookup simply hits the database.
+"""
+from contextvars import ContextVar
+
+from rest_framework.authtoken.models import Token
+
+from . import sharding
+from .models import User
+
+_identity_map = ContextVar('identity_map', default=None)
+
+
+class IdentityMap:
+    def __init__(self):
+        self.users = {}  # pk -> User
+        self.user_emails = {}  # email -> pk
+        self.tokens = {}  # key -> Token
+        self.user_tokens = {}  # user pk -> Token
+
+
+def activate():
+    """
+    Activate a new, empty map for the current context, returns the token to pass to `deactivate()`.
+    """
+    return _identity_map.set(IdentityMap())
+
+
+def deactivate(token):
+    _identity_map.reset(token)
+
+
+def get_user(pk=None, email=None):
+    """
+    Return the user with the given pk or email, raises `User.DoesNotExist` like `User.objects.get()`.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        if email is not None:
+            pk = identity_map.user_emails.get(email)
+        if pk in identity_map.users:
+            return identity_map.users[pk]
+
+    if email is not None:
+        return remember(User.objects.for_email(email).get(email=email))
+    return remember(sharding.get_user(pk))
+
+
+def get_token(key=None, user=None):
+    """
+    Return the token with the given key or of the given user, raises `Token.DoesNotExist` like `Token.objects.get()`.
+    The user of the token is loaded with the same query, and is the instance the map returns for that user.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        token = identity_map.tokens.get(key) if key is not None else identity_map.user_tokens.get(user.pk)
+        if token is not None:
+            return token
+
+    if key is not None:
+        tokens = Token.objects.db_manager(sharding.shard_for_token_key(key)).filter(key=key)
+    else:
+        tokens = Token.objects.db_manager(hints={'instance': user}).filter(user=user)
+    return remember(tokens.select_related('user').get())
+
+
+def delete_tokens(user):
+    """
+    Delete the tokens of the user and drop them from the map.
+    """
+    Token.objects.db_manager(hints={'instance': user}).filter(user=user).delete()
+
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        token = identity_map.user_tokens.pop(user.pk, None)
+        if token is not None:
+            identity_map.tokens.pop(token.key, None)
+
+
+def remember(instance):
+    """
+    Add a freshly loaded or saved `User` or `Token` to the map, and return it.
+
+    The latest instance of a row wins, so a token loaded before its user was saved from another instance points to
+    the saved one.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is None:
+        return instance
+
+    if isinstance(instance, User):
+        _forget_user(identity_map, instance.pk)
+        identity_map.users[instance.pk] = instance
+        identity_map.user_emails[instance.email] = instance.pk
+
+        token = identity_map.user_tokens.get(instance.pk)
+        if token is not None and token._state.db == instance._state.db:
+            token.user = instance
+        elif token is not None:
+            # the user moved to another shard (see `sharding.save_user()`), its old token stays behind
+            forget(token)
+
+    elif isinstance(instance, Token):
+        identity_map.tokens[instance.key] = instance
+        identity_map.user_tokens[instance.user_id] = instance
+
+        if Token.user.is_cached(instance):
+            remember(instance.user)
+
+    return instance
+
+
+def forget(instance):
+    """
+    Drop a `User` or `Token` from the map, e.g. after it has been deleted. A deleted user takes its token with it (the
+    database cascades the delete).
+
+    Only the row of the database the instance comes from is dropped: when `sharding.save_user()` deletes the old copy
+    of a user that moved, the copy just saved on the new shard stays.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is None:
+        return
+
+    if isinstance(instance, User):
+        cached = identity_map.users.get(instance.pk)
+        if cached is None or cached._state.db == instance._state.db:
+            _forget_user(identity_map, instance.pk)
+
+        token = identity_map.user_tokens.get(instance.pk)
+        if token is not None and token._state.db == instance._state.db:
+            forget(token)
+
+    elif isinstance(instance, Token):
+        identity_map.tokens.pop(instance.key, None)
+        if identity_map.user_tokens.get(instance.user_id) is instance:
+            del identity_map.user_tokens[instance.user_id]
+
+
+def _forget_user(identity_map, pk):
+    identity_map.users.pop(pk, None)
+    for email in [email for email, user_pk in identity_map.user_emails.items() if user_pk == pk]:
+        del identity_map.user_emails[email]
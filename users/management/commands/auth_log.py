@@ -0,0 +1,133 @@
+"""
+`python manage.py auth_log`: query the authentication event log (see `users/auth_log.py`).
+
+The log files are memory-mapped and scanned line by line, a line is only decoded when it can match the filters, so
+the command runs in constant memory whatever the size of the log.
+
+Examples:
+    python manage.py auth_log --count-by event
+    python manage.py auth_log --event signin_failed --since 2023-04-01 --count-by email --limit 20
+    python manage.py auth_log --email john@example.com
+    python manage.py auth_log --benchmark 100000
+"""
+import json
+import mmap
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users import auth_log
+
+
+def scan(path):
+    """
+    Yield the lines of a log file, without reading the whole file in memory.
+    """
+    with open(path, 'rb') as file:
+        if file.seek(0, 2) == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while True:
+                end = data.find(b'\n', start)
+                if end == -1:
+                    break
+                yield data[start:end]
+                start = end + 1
+
+
+class Command(BaseCommand):
+    help = 'Query and aggregate the authentication event log.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--event', choices=auth_log.EVENTS, help='Only this event.')
+        parser.add_argument('--email', help='Only the events of this email address.')
+        parser.add_argument('--since', type=datetime.fromisoformat, help='Only events since this date/time.')
+        parser.add_argument('--until', type=datetime.fromisoformat, help='Only events before this date/time.')
+        parser.add_argument(
+            '--count-by', choices=('event', 'day', 'email', 'ip'),
+            help='Print the number of events by this field instead of the events.'
+        )
+        parser.add_argument('--limit', type=int, help='Print at most this many events or groups.')
+        parser.add_argument(
+            '--benchmark', type=int, metavar='EVENTS',
+            help='Append this many events to a temporary log, report the throughput and exit.'
+        )
+
+    def handle(self, *args, **options):
+        if options['benchmark']:
+            return self.benchmark(options['benchmark'])
+
+        # cheap substring checks on the raw line, the record is only decoded when they all match
+        needles = []
+        if options['event']:
+            needles.append(json.dumps({'e': options['event']}, separators=(',', ':'))[1:-1].encode())
+        if options['email']:
+            needles.append(
+                json.dumps({'email': options['email']}, separators=(',', ':'), ensure_ascii=False)[1:-1].encode()
+            )
+        since = options['since'].timestamp() if options['since'] else None
+        until = options['until'].timestamp() if options['until'] else None
+
+        auth_log.log.flush()
+        counts = Counter()
+        printed = 0
+        for path in auth_log.iter_files(settings.AUTH_LOG_DIR):
+            for line in scan(path):
+                if not all(needle in line for needle in needles):
+                    continue
+
+                record = json.loads(line)
+                if (since is not None and record['t'] < since) or (until is not None and record['t'] >= until):
+                    continue
+
+                if options['count_by'] == 'event':
+                    counts[record['e']] += 1
+                elif options['count_by'] == 'day':
+                    counts[datetime.fromtimestamp(record['t']).date().isoformat()] += 1
+                elif options['count_by']:
+                    counts[record[options['count_by']]] += 1
+                else:
+                    if options['limit'] is not None and printed >= options['limit']:
+                        return
+                    self.stdout.write(line.decode())
+                    printed += 1
+
+        if options['count_by']:
+            groups = counts.most_common(options['limit'])
+            if options['count_by'] == 'day':
+                groups.sort()
+            for key, count in groups:
+                self.stdout.write(f'{count:>10}  {key}')
+
+    def benchmark(self, events):
+        with tempfile.TemporaryDirectory() as directory:
+            log = auth_log.AuthEventLog(
+                directory, batch_size=settings.AUTH_LOG_BATCH_SIZE, flush_interval=settings.AUTH_LOG_FLUSH_INTERVAL,
+                max_bytes=settings.AUTH_LOG_MAX_BYTES,
+            )
+
+            started = time.perf_counter()
+            for i in range(events):
+                log.append(auth_log.SIGNIN, user_id=i, email=f'user{i}@example.com', ip='10.0.0.1')
+            log.flush()
+            written = time.perf_counter() - started
+
+            size = sum(path.stat().st_size for path in auth_log.iter_files(directory))
+            started = time.perf_counter()
+            scanned = sum(1 for path in auth_log.iter_files(directory) for line in scan(path) if b'"u":7' in line)
+            scan_time = time.perf_counter() - started
+
+        if scanned == 0:
+            raise CommandError('The benchmark log could not be read back.')
+
+        self.stdout.write(
+            f'write: {events} events, {size / 1024 / 1024:.1f} MiB in {written * 1000:.0f} ms, '
+            f'{events / written:,.0f} events/s, {written / events * 1_000_000:.1f} us per event (per request)\n'
+            f'scan:  {size / 1024 / 1024:.1f} MiB in {scan_time * 1000:.0f} ms, '
+            f'{size / 1024 / 1024 / scan_time:,.0f} MiB/s'
+        )
@@ -0,0 +1,75 @@
+"""
+`python manage.py benchmark_me`: throughput of a client polling `/users/me/`, with and without conditional requests.
+
+A throw-away user and token are created in a transaction that is rolled back at the end, then `/users/me/` is requested
+in-process (through the whole middleware stack, without network) by a client that ignores the ETag, and by a client
+that sends it back in `If-None-Match`.
+
+Example:
+    python manage.py benchmark_me --requests 5000
+"""
+import time
+
+from django.core import signals
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from users import sharding
+from users.models import User
+
+EMAIL = 'benchmark-me@example.com'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark polling `/users/me/` with and without `If-None-Match`.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per run.')
+
+    def handle(self, *args, **options):
+        # like Django's test client does in tests: closing the connection at the end of each request would roll back
+        # the transaction that holds the benchmark user
+        signals.request_started.disconnect(close_old_connections)
+        signals.request_finished.disconnect(close_old_connections)
+        try:
+            self.benchmark(options['requests'])
+        finally:
+            signals.request_started.connect(close_old_connections)
+            signals.request_finished.connect(close_old_connections)
+
+    def benchmark(self, requests):
+        database = sharding.shard_for_email(EMAIL) or 'default'
+
+        with transaction.atomic(using=database), override_settings(ALLOWED_HOSTS=['testserver']):
+            user = User.objects.db_manager(database).create_user(EMAIL, password=None)
+            token = Token.objects.db_manager(hints={'instance': user}).create(user=user)
+            client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+            url = reverse('me')
+
+            etag = client.get(url)['ETag']
+            for name, headers in (('unconditional', {}), ('If-None-Match', {'HTTP_IF_NONE_MATCH': etag})):
+                queries = 0
+
+                def count_queries(execute, sql, params, many, context):
+                    nonlocal queries
+                    queries += 1
+                    return execute(sql, params, many, context)
+
+                with connections[database].execute_wrapper(count_queries):
+                    started = time.perf_counter()
+                    for _ in range(requests):
+                        response = client.get(url, **headers)
+                    elapsed = time.perf_counter() - started
+
+                self.stdout.write(
+                    f'{name:>14}: {requests / elapsed:8,.0f} req/s, '
+                    f'{elapsed / requests * 1_000_000:6.0f} us/req, '
+                    f'{queries / requests:.1f} queries/req, '
+                    f'status {response.status_code}, {len(response.content)} bytes'
+                )
+
+            transaction.set_rollback(True, using=database)
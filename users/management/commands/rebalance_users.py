@@ -0,0 +1,59 @@
+"""
+`python manage.py rebalance_users`: move every user to the shard its email hashes to.
+
+Run it after changing `USER_SHARDS` (see `users/sharding.py`), e.g. after adding a shard and migrating it. With
+rendezvous hashing, adding a shard to N existing ones moves about 1/(N+1) of the users. A moved user keeps its id, its
+token gets a new key (tagged with the new shard) so that client has to sign in again; the tokens of the users that
+don't move are not affected. Group and permission memberships are not carried over.
+
+Examples:
+    python manage.py rebalance_users --dry-run
+    python manage.py rebalance_users --database users_0
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users import sharding
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Move the users (and their tokens) to the shard their email hashes to.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', action='append', dest='databases',
+            help='Only move users out of this database (can be repeated, default: every shard and `default`).'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many users would move.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of users read at once.')
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Users are not sharded, set `USER_SHARDS` in settings.')
+
+        # `default` holds the users created before sharding was enabled
+        sources = options['databases'] or list(dict.fromkeys([*settings.USER_SHARDS, 'default']))
+
+        moved = rekeyed_tokens = 0
+        for source in sources:
+            # collect the misplaced users first, so that moving them does not shift the rows being read
+            misplaced = [
+                pk for pk, email in User.objects.using(source).values_list('pk', 'email')
+                .iterator(chunk_size=options['batch_size'])
+                if sharding.shard_for_email(email) != source
+            ]
+            self.stdout.write(f'{source}: {len(misplaced)} users to move')
+
+            if options['dry_run']:
+                moved += len(misplaced)
+                continue
+
+            for start in range(0, len(misplaced), options['batch_size']):
+                for user in User.objects.using(source).filter(pk__in=misplaced[start:start + options['batch_size']]):
+                    if sharding.save_user(user) is not None:
+                        rekeyed_tokens += 1
+                    moved += 1
+
+        verb = 'would move' if options['dry_run'] else 'moved'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} users, {rekeyed_tokens} tokens got a new key'))
@@ -0,0 +1,159 @@
+"""
+Production entry point: `python manage.py serve`.
+
+`runserver` is a development server, it runs a single process that imports the views, builds the url resolvers and
+generates the schema on the first request. This command runs the project under gunicorn instead:
+
+    - the application is loaded and warmed up (see `config.warmup`) in the master process *before* forking, so workers
+      share the imported code copy-on-write and are ready to answer as soon as they are spawned.
+    - the number of workers and threads is sized to the cpu cores available to the process, and capped so that the
+      persistent database connections (one per thread, see `CONN_MAX_AGE`) fit in `DATABASE_CONNECTION_BUDGET`.
+    - single-threaded workers open their database connections before accepting traffic.
+    - startup time, rss of every worker and the latency of its first request are written to the gunicorn log.
+
+Reloading:
+    `kill -HUP <master pid>` gracefully replaces the workers (in-flight requests are finished), but since the app is
+    preloaded they keep running the code of the master. To deploy new code without downtime send `USR2` (a new master
+    is started with the new code), then `WINCH` and `QUIT` to the old master.
+"""
+import math
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+
+from config import warmup
+
+# concurrent requests per core, a request spends most of its time waiting on the database
+REQUESTS_PER_CORE = 4
+
+
+def available_cores():
+    """
+    Number of cores this process may run on, which respects the cpu affinity set by docker/cgroups.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_threads(cores, workers):
+    """
+    Threads per worker that serve about `REQUESTS_PER_CORE` concurrent requests per core.
+    """
+    return max(1, math.ceil(cores * REQUESTS_PER_CORE / workers))
+
+
+def cap_to_connections(workers, threads, budget):
+    """
+    Return `(workers, threads)` reduced, threads first, so that `workers * threads` connections fit in `budget`.
+    """
+    if workers * threads <= budget:
+        return workers, threads
+    threads = max(1, budget // workers)
+    return max(1, min(workers, budget // threads)), threads
+
+
+class Command(BaseCommand):
+    help = 'Run the project with gunicorn, using preloaded and warmed up workers.'
+
+    def add_arguments(self, parser):
+        cores = available_cores()
+        parser.add_argument('--bind', default='0.0.0.0:8000', help='Address to listen on.')
+        parser.add_argument(
+            '--workers', type=int, default=cores * 2 + 1,
+            help=f'Number of worker processes (default: 2 * cores + 1 = {cores * 2 + 1}).'
+        )
+        parser.add_argument(
+            '--threads', type=int,
+            help=f'Threads per worker, more than one uses the `gthread` worker class (default: about '
+                 f'{REQUESTS_PER_CORE} concurrent requests per core, {default_threads(cores, cores * 2 + 1)} with the '
+                 f'default workers).'
+        )
+        parser.add_argument(
+            '--max-connections', type=int, default=settings.DATABASE_CONNECTION_BUDGET,
+            help='Connections to each database the workers may hold, workers * threads is capped to it '
+                 '(default: `DATABASE_CONNECTION_BUDGET` = %(default)s).'
+        )
+        parser.add_argument('--timeout', type=int, default=30, help='Seconds before a silent worker is restarted.')
+        parser.add_argument(
+            '--max-requests', type=int, default=0,
+            help='Restart a worker after this many requests, to bound memory growth (default: 0, disabled).'
+        )
+        parser.add_argument('--no-schema-warmup', action='store_true', help='Do not generate the OpenAPI schema.')
+
+    def handle(self, *args, **options):
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            raise CommandError('gunicorn is not installed, run `pip install -r requirements.txt`.')
+
+        started = time.perf_counter()
+        schema = not options['no_schema_warmup']
+        stdout = self.stdout
+
+        requested = options['workers'], options['threads'] or default_threads(available_cores(), options['workers'])
+        workers, threads = cap_to_connections(*requested, options['max_connections'])
+        if (workers, threads) != requested:
+            stdout.write(
+                f'Capped to {workers} workers * {threads} threads to hold at most {options["max_connections"]} '
+                f'connections per database'
+            )
+
+        class Application(BaseApplication):
+            def load_config(self):
+                self.cfg.set('bind', options['bind'])
+                self.cfg.set('workers', workers)
+                self.cfg.set('threads', threads)
+                self.cfg.set('worker_class', 'gthread' if threads > 1 else 'sync')
+                self.cfg.set('timeout', options['timeout'])
+                self.cfg.set('max_requests', options['max_requests'])
+                self.cfg.set('max_requests_jitter', options['max_requests'] // 10)
+                self.cfg.set('preload_app', True)
+                self.cfg.set('accesslog', '-')
+                self.cfg.set('when_ready', when_ready)
+                self.cfg.set('post_worker_init', post_worker_init)
+                self.cfg.set('pre_request', pre_request)
+                self.cfg.set('post_request', post_request)
+                self.cfg.set('worker_exit', worker_exit)
+
+            def load(self):
+                application = get_wsgi_application()
+                elapsed = warmup.warmup(schema=schema)
+                stdout.write(f'Warmup done in {elapsed * 1000:.0f} ms, master rss {warmup.current_rss() >> 20} MiB')
+                return application
+
+        def when_ready(server):
+            server.log.info('Ready in %.0f ms', (time.perf_counter() - started) * 1000)
+
+        def post_worker_init(worker):
+            # connections belong to a thread: `gthread` workers serve from a pool of threads started after this hook,
+            # each one connects on its first request
+            if threads == 1:
+                warmup.warm_connections()
+            worker.first_request_served = False
+            worker.log.info('Worker %s ready, rss %s MiB', worker.pid, warmup.current_rss() >> 20)
+
+        def pre_request(worker, req):
+            if not worker.first_request_served:
+                worker.first_request_started = time.perf_counter()
+
+        def post_request(worker, req, environ, resp):
+            if not worker.first_request_served:
+                worker.first_request_served = True
+                worker.log.info(
+                    'Worker %s first request %s %s in %.1f ms, rss %s MiB',
+                    worker.pid, req.method, req.path,
+                    (time.perf_counter() - worker.first_request_started) * 1000,
+                    warmup.current_rss() >> 20,
+                )
+
+        def worker_exit(server, worker):
+            from users import auth_log
+
+            auth_log.log.flush()
+
+        Application().run()
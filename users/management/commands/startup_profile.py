@@ -0,0 +1,111 @@
+"""
+`python manage.py startup_profile`: measure the cold start of the project.
+
+Every role (see `ROLE` in settings) is started in a fresh interpreter with `python -X importtime`, the same way a
+worker would start: `django.setup()`, then, for the roles that serve HTTP, the wsgi application and the url resolvers.
+For each role it reports the wall-clock startup time and the rss of the process, then the modules with the highest
+import cost.
+
+Examples:
+    python manage.py startup_profile
+    python manage.py startup_profile --role api worker --limit 40 --sort self
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# run in the child interpreter, it prints a json report on its last line of stdout
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+
+import django
+django.setup()
+
+from django.conf import settings
+if settings.ROLE != 'worker':
+    from django.urls import get_resolver
+    from config.wsgi import application
+    get_resolver().reverse_dict
+
+elapsed = time.perf_counter() - started
+
+from config.warmup import current_rss
+print(json.dumps({'startup': elapsed, 'rss': current_rss()}))
+"""
+
+# `import time: self [us] | cumulative | imported package`, nested imports are indented in the last column
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = 'Report startup time, memory and per-module import cost of each role.'
+
+    def add_arguments(self, parser):
+        roles = list(settings.ROLE_EXCLUDED_APPS)
+        parser.add_argument(
+            '--role', nargs='+', choices=roles, default=roles, help='Roles to profile (default: all of them).'
+        )
+        parser.add_argument('--limit', type=int, default=25, help='Number of modules to list per role.')
+        parser.add_argument(
+            '--sort', choices=('cumulative', 'self'), default='cumulative',
+            help='Order the modules by cumulative import time (including their imports) or by their own time.'
+        )
+
+    def handle(self, *args, **options):
+        reports = {role: self.profile(role) for role in options['role']}
+
+        for role, report in reports.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'\nrole={role}  startup={report["startup"] * 1000:.0f} ms  rss={report["rss"] >> 20} MiB  '
+                f'modules={len(report["modules"])}'
+            ))
+            self.stdout.write(f'{"self ms":>9} {"cumul. ms":>10}  module')
+
+            modules = sorted(report['modules'], key=lambda module: module[options['sort']], reverse=True)
+            for module in modules[:options['limit']]:
+                self.stdout.write(
+                    f'{module["self"] / 1000:9.1f} {module["cumulative"] / 1000:10.1f}  '
+                    f'{"  " * module["depth"]}{module["name"]}'
+                )
+
+        if 'all' in reports and len(reports) > 1:
+            baseline = reports['all']
+            self.stdout.write(self.style.MIGRATE_HEADING('\nCompared to role=all'))
+            for role, report in reports.items():
+                if role == 'all':
+                    continue
+                self.stdout.write(
+                    f'{role:>8}: startup {(report["startup"] - baseline["startup"]) * 1000:+.0f} ms, '
+                    f'rss {(report["rss"] - baseline["rss"]) >> 20:+d} MiB, '
+                    f'modules {len(report["modules"]) - len(baseline["modules"]):+d}'
+                )
+
+    def profile(self, role):
+        env = dict(os.environ, DJANGO_ROLE=role)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Startup of role={role} failed:\n{result.stderr[-2000:]}')
+
+        modules = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_LINE.match(line)
+            if match:
+                modules.append({
+                    'self': int(match[1]),
+                    'cumulative': int(match[2]),
+                    'depth': (len(match[3]) - 1) // 2,
+                    'name': match[4],
+                })
+
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        report['modules'] = modules
+        return report
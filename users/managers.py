@@ -4,6 +4,8 @@ By doing so, you can keep your models lean and clean and separate the model logi
 """
 from django.contrib.auth.base_user import BaseUserManager
 
+from . import sharding
+
 
 class UserManager(BaseUserManager):
     """
@@ -31,7 +33,7 @@ class UserManager(BaseUserManager):
         # `normalize_email` ensure that the email address is correctly formatted and valid before saved to the database
         user = self.model(email=self.normalize_email(email), **extra_fields)
         user.set_password(password)
-        user.save(using=self._db)
+        user.save(using=self._db, force_insert=True)
 
         """
         about: `self._db`
@@ -41,9 +43,25 @@ class UserManager(BaseUserManager):
         `self._db` is a reference to the database that the UserManager should use to save the user object.
         It is typically used to support multi-database applications where different models are saved to different 
         databases.
+
+        When users are sharded (see `users/sharding.py`) and `self._db` is not set, the database router places the user
+        on the shard of its email.
         """
         return user
 
+    def for_email(self, email):
+        """
+        Returns a manager using the database that holds the user with this email: its shard when users are sharded,
+        otherwise the database of this manager.
+        """
+        return self.db_manager(sharding.shard_for_email(email) or self._db)
+
+    def get_by_natural_key(self, username):
+        """
+        Used by `authenticate()` to load the user by email, on its shard.
+        """
+        return self.for_email(username).get(**{self.model.USERNAME_FIELD: username})
+
     def create_superuser(self, email, password=None, **extra_fields):
         """
         Creates and saves a superuser with the given email and password.
@@ -0,0 +1,18 @@
+from . import identity_map
+
+
+class IdentityMapMiddleware:
+    """
+    Activate a `users.identity_map` for the duration of each request, so repeated `User`/`Token` lookups in the same
+    request are answered without a query. The map is dropped when the response is returned.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = identity_map.activate()
+        try:
+            return self.get_response(request)
+        finally:
+            identity_map.deactivate(token)
@@ -6,13 +6,39 @@ from .managers import UserManager
 class User(AbstractUser):
     email = models.EmailField(max_length=255, unique=True)
     username = models.CharField(max_length=255, blank=False, null=False)
+
+    # bumped by every save that may change what `/users/me/` returns, it's the ETag of that endpoint (see `MeView`)
+    version = models.PositiveIntegerField(default=0, editable=False)
+
     USERNAME_FIELD = 'email'
 
     # fix error [users.User: (auth.E002)], so you should remove 'email' from the 'REQUIRED_FIELDS', like this.
     REQUIRED_FIELDS = []
 
+    # the fields returned by `/users/me/`
+    PUBLIC_FIELDS = ('id', 'email', 'first_name', 'last_name', 'date_joined')
+
     objects = UserManager()
 
     def save(self, *args, **kwargs):
         self.username = self.email
+
+        # partial saves of private fields (e.g. `update_last_login()`) don't change what `/users/me/` returns
+        update_fields = kwargs.get('update_fields')
+        bumped_in_sql = False
+        if update_fields is None or set(update_fields) & set(self.PUBLIC_FIELDS):
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version'}
+
+            if self._state.adding or kwargs.get('force_insert'):
+                self.version += 1
+            else:
+                # incremented in SQL, so that two concurrent saves can't write the same version
+                self.version = models.F('version') + 1
+                bumped_in_sql = True
+
         super().save(*args, **kwargs)
+
+        # the incremented version is read back from the database the next time it's accessed
+        if bumped_in_sql:
+            del self.version
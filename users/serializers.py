@@ -5,6 +5,7 @@ from django.db import IntegrityError
 from rest_framework import serializers
 from rest_framework.authtoken.models import Token
 
+from users import identity_map
 from users.models import User
 
 
@@ -74,6 +75,13 @@ class SignupSerializer(serializers.Serializer):
             raise serializers.ValidationError({'email': ['This email address is already taken.']})
 
 
+class UserSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = User.PUBLIC_FIELDS
+        read_only_fields = fields
+
+
 class TokenSerializer(serializers.ModelSerializer):
     class Meta:
         model = Token
@@ -84,9 +92,9 @@ class PasswordResetSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
     def validate(self, data):
-        if get_user_model().objects.filter(email=data.get('email')).exists():
-            data['user'] = User.objects.get(email=data.get('email'))
-        else:
+        try:
+            data['user'] = identity_map.get_user(email=data.get('email'))
+        except User.DoesNotExist:
             raise serializers.ValidationError("This email address is not associated with any user account.")
         return data
 
@@ -99,7 +107,7 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
 
         # validate token
         try:
-            data['token'] = Token.objects.get(key=self.context['token'])
+            data['token'] = identity_map.get_token(key=self.context['token'])
         except Token.DoesNotExist:
             raise serializers.ValidationError('Invalid password reset.')
 
@@ -116,7 +124,7 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         user.save()
 
         # Delete the token after password reset
-        token.delete()
+        identity_map.delete_tokens(user)
         return user
 
 
@@ -155,7 +163,7 @@ class ChangeEmailSerializer(serializers.Serializer):
             raise serializers.ValidationError('Invalid password')
 
         # check email uniqueness
-        if User.objects.filter(email=data.get('email')).exists():
+        if User.objects.for_email(data.get('email')).filter(email=data.get('email')).exists():
             raise serializers.ValidationError('Email already in use')
 
         return data.get('email')
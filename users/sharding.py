@@ -0,0 +1,194 @@
+"""
+Optional hash-based horizontal sharding of `users.User` and `authtoken.Token`.
+
+Set `USER_SHARDS` in settings to the database aliases that hold users, e.g. with two local SQLite databases:
+
+    DATABASES['users_0'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'users_0.sqlite3'}
+    DATABASES['users_1'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'users_1.sqlite3'}
+    USER_SHARDS = ['users_0', 'users_1']
+
+then run `python manage.py migrate --database=<alias>` for every shard. With an empty `USER_SHARDS` (the default)
+nothing is routed and everything lives in the `default` database.
+
+Placement:
+    - a user lives on the shard chosen by rendezvous hashing of its normalized email, so a lookup by email (signin,
+      password reset, email uniqueness) goes straight to one shard. Rendezvous hashing only moves ~1/N of the users when
+      a shard is added, see `python manage.py rebalance_users`.
+    - a token lives on the shard of its user, and its key starts with the tag of that shard (a hash of its alias, see
+      `shard_tag()`), so token authentication routes by the key alone, whatever shards are added later. Keys without
+      a known tag (tokens created before sharding was enabled) are looked up in `default`.
+    - user ids are generated (milliseconds since 2023 and random bits, 53 bits in all so JavaScript clients read them
+      exactly) instead of taken from a per-database sequence, so they stay unique across shards. A lookup by id has to
+      ask every shard, see `get_user()`.
+
+Code that works with the tokens of a user must route through the user, like Django's related managers do:
+`Token.objects.db_manager(hints={'instance': user})`.
+
+Group and permission memberships of users are not sharded: `auth.Group` and `auth.Permission` live in `default`, and
+the memberships of a user are not carried over when it moves to another shard (see `save_user()`).
+"""
+import binascii
+import hashlib
+import os
+import secrets
+import time
+
+from django.conf import settings
+from django.contrib.auth.base_user import BaseUserManager
+from django.db import transaction
+
+USER_MODEL = 'users.User'
+TOKEN_MODEL = 'authtoken.Token'
+
+# length, in hex digits, of the shard tag at the start of the token keys
+SHARD_TAG_LENGTH = 4
+
+# user ids are `milliseconds since this epoch << ID_RANDOM_BITS | random bits`. They are sent as JSON numbers, so they
+# must stay below 2 ** 53 to be read exactly by JavaScript clients: 41 bits of milliseconds last until 2092
+ID_EPOCH_MS = 1672531200000  # 2023-01-01
+ID_TIME_BITS = 41
+ID_RANDOM_BITS = 12
+
+
+def enabled():
+    return bool(settings.USER_SHARDS)
+
+
+def _rendezvous(value):
+    """
+    Return the shard with the highest hash of (shard, value). Unlike `hash % len(shards)`, adding a shard only moves the
+    values the new shard wins.
+    """
+    return max(
+        settings.USER_SHARDS,
+        key=lambda shard: hashlib.blake2b(f'{shard}:{value}'.encode(), digest_size=8).digest(),
+    )
+
+
+def shard_for_email(email):
+    """
+    Return the database alias of the user with this email, or `None` when sharding is disabled.
+    """
+    if not enabled():
+        return None
+    return _rendezvous(BaseUserManager.normalize_email(email).lower())
+
+
+def shard_tag(shard):
+    """
+    Return the tag of a shard, the prefix of the keys of the tokens it holds. It only depends on the alias of the shard,
+    so it doesn't change when shards are added or reordered.
+    """
+    return hashlib.blake2b(shard.encode(), digest_size=8).hexdigest()[:SHARD_TAG_LENGTH]
+
+
+def shard_for_token_key(key):
+    """
+    Return the database alias of the token with this key, or `None` when sharding is disabled.
+    """
+    if not enabled():
+        return None
+
+    tag = key[:SHARD_TAG_LENGTH]
+    for shard in settings.USER_SHARDS:
+        if shard_tag(shard) == tag:
+            return shard
+    return 'default'
+
+
+def shard_for_user(user):
+    return user._state.db or shard_for_email(user.email)
+
+
+def generate_user_id():
+    """
+    Generate a user id that fits in `ID_TIME_BITS + ID_RANDOM_BITS` (53) bits.
+    """
+    return (int(time.time() * 1000) - ID_EPOCH_MS) << ID_RANDOM_BITS | secrets.randbits(ID_RANDOM_BITS)
+
+
+def generate_token_key(shard):
+    """
+    Generate a token key of the same length as `Token.generate_key()`, that starts with the tag of `shard`.
+    """
+    return shard_tag(shard) + binascii.hexlify(os.urandom(20)).decode()[SHARD_TAG_LENGTH:]
+
+
+def get_user(pk):
+    """
+    Return the user with this id, looking for it on every shard. Raises `User.DoesNotExist`.
+    """
+    from .models import User
+
+    if not enabled():
+        return User.objects.get(pk=pk)
+
+    for shard in settings.USER_SHARDS:
+        try:
+            return User.objects.using(shard).get(pk=pk)
+        except User.DoesNotExist:
+            continue
+    raise User.DoesNotExist(f'User matching id {pk} does not exist on any shard.')
+
+
+def save_user(user):
+    """
+    Save a user on the shard of its email. When its email belongs to another shard than the one holding it (e.g. after
+    a change of email, or after shards were added), the user, with its unsaved changes, is copied to the new shard and
+    deleted from the old one, and its token gets a new key tagged with the new shard.
+    Returns the new token when the user has moved and had one, `None` otherwise.
+
+    The copy is committed before the delete: a failure between the two databases leaves a stale duplicate on the old
+    shard, that lookups by the new email never reach, rather than a lost user.
+    Group and permission memberships are not carried over to the new shard.
+    """
+    from rest_framework.authtoken.models import Token
+    from .models import User
+
+    source = user._state.db
+    shard = shard_for_email(user.email)
+    if not enabled() or source is None or source == shard:
+        user.save()
+        return None
+
+    with transaction.atomic(using=source), transaction.atomic(using=shard):
+        had_token = Token.objects.using(source).filter(user=user).exists()
+
+        user.save(using=shard, force_insert=True)
+        token = Token.objects.using(shard).create(user=user) if had_token else None
+
+        User.objects.using(source).filter(pk=user.pk).delete()
+
+    return token
+
+
+class ShardRouter:
+    """
+    Database router of users and tokens, listed in `DATABASE_ROUTERS`. It only routes when the query carries an
+    instance hint (saving, deleting, related managers, `db_manager(hints={'instance': ...})`), lookups by email or key
+    choose their shard explicitly (`UserManager.for_email()`, `shard_for_token_key()`).
+    """
+
+    def _db_for_instance(self, model, instance):
+        if not enabled() or model._meta.label not in (USER_MODEL, TOKEN_MODEL) or instance is None:
+            return None
+
+        # an instance loaded from a shard keeps its related rows on that shard
+        if instance._state.db:
+            return instance._state.db
+
+        if instance._meta.label == USER_MODEL:
+            return shard_for_email(instance.email)
+
+        if instance._meta.label == TOKEN_MODEL:
+            if type(instance).user.is_cached(instance):
+                return shard_for_user(instance.user)
+            return shard_for_token_key(instance.key)
+
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for_instance(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for_instance(model, hints.get('instance'))
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from . import identity_map, sharding
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Token)
+def remember_saved(sender, instance, **kwargs):
+    """
+    Keep the request identity map coherent: a saved user or token replaces the instance the map holds for its row.
+    """
+    identity_map.remember(instance)
+
+
+@receiver(post_delete, sender=User)
+def forget_deleted_user(sender, instance, **kwargs):
+    identity_map.forget(instance)
+
+
+@receiver(pre_save, sender=User)
+def generate_sharded_user_id(sender, instance, **kwargs):
+    """
+    Sharded users get an id that is unique across shards instead of one from the sequence of their database.
+    """
+    if sharding.enabled() and instance.pk is None:
+        instance.pk = sharding.generate_user_id()
+
+
+@receiver(pre_save, sender=Token)
+def generate_sharded_token_key(sender, instance, using, **kwargs):
+    """
+    A new token is saved on the shard of its user, give it a key tagged with that shard so it can be found by key.
+    """
+    if sharding.enabled() and instance._state.adding and sharding.shard_for_token_key(instance.key) != using:
+        instance.key = sharding.generate_token_key(using)
@@ -1,3 +1,363 @@
-from django.test import TestCase
+import io
+import json
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import update_last_login
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from . import auth_log, identity_map, sharding
+from .models import User
+
+PASSWORD = 'Str0ng-Passw0rd!'
+NEW_PASSWORD = 'An0ther-Passw0rd!'
+
+
+class UsersTestCase(TestCase):
+    """
+    Writes the auth event log of the tests to a temporary directory.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        patcher = mock.patch.multiple(auth_log.log, directory=Path(directory.name), _path=None)
+        patcher.start()
+        cls.addClassCleanup(patcher.stop)
+        cls.addClassCleanup(auth_log.log.flush)
+
+    def create_user(self, email='john@example.com', **extra_fields):
+        return User.objects.create_user(email, PASSWORD, **extra_fields)
+
+    def auth(self, user):
+        token, _ = Token.objects.db_manager(hints={'instance': user}).get_or_create(user=user)
+        return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+
+class QueriesPerRequestTest(UsersTestCase):
+    """
+    Number of queries of every route of `users/urls.py`, savepoints included. The routes that used to load the same row
+    twice (password reset, password reset confirmation, signup confirmation) now load it once, through the identity map.
+    """
+
+    def test_signin(self):
+        self.create_user()
+        # user, token, savepoint + token insert + release, last login
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('signin'), {'email': 'john@example.com', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+
+    def test_signup(self):
+        data = {'email': 'john@example.com', 'password': PASSWORD, 'confirm_password': PASSWORD}
+        # user insert + update, token, savepoint + token insert + release
+        with self.assertNumQueries(6):
+            response = self.client.post(reverse('signup'), data)
+        self.assertEqual(response.status_code, 201)
+
+    def test_confirm_signup(self):
+        user = self.create_user(is_active=False)
+        token = Token.objects.create(user=user)
+        # token joined with its user, user update
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('confirm_signup', args=[token.key]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        headers = self.auth(self.create_user())
+        # token auth, token delete
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('logout'), **headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_reset(self):
+        self.create_user()
+        # user, token delete, token insert
+        with self.assertNumQueries(3):
+            response = self.client.post(reverse('password_reset'), {'email': 'john@example.com'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_reset_confirm(self):
+        token = Token.objects.create(user=self.create_user())
+        data = {'new_password': NEW_PASSWORD, 'confirm_new_password': NEW_PASSWORD}
+        # token joined with its user, user update, token delete
+        with self.assertNumQueries(3):
+            response = self.client.post(reverse('password_reset_confirm', args=[token.key]), data)
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_password(self):
+        headers = self.auth(self.create_user())
+        data = {'old_password': PASSWORD, 'new_password': NEW_PASSWORD, 'confirm_new_password': NEW_PASSWORD}
+        # token auth, user update
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('change_password'), data, **headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_email(self):
+        headers = self.auth(self.create_user())
+        # token auth, email uniqueness, user update
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                reverse('change_email'), {'email': 'jane@example.com', 'password': PASSWORD}, **headers
+            )
+        self.assertEqual(response.status_code, 200)
+
+
+class IdentityMapTest(UsersTestCase):
+    def setUp(self):
+        self.user = self.create_user()
+        self.token = Token.objects.create(user=self.user)
+
+        context = identity_map.activate()
+        self.addCleanup(identity_map.deactivate, context)
+
+    def test_repeated_lookups_cost_no_query(self):
+        with self.assertNumQueries(1):
+            user = identity_map.get_user(email='john@example.com')
+        with self.assertNumQueries(0):
+            self.assertIs(identity_map.get_user(email='john@example.com'), user)
+            self.assertIs(identity_map.get_user(pk=self.user.pk), user)
+
+    def test_token_and_user_loaded_together(self):
+        with self.assertNumQueries(1):
+            token = identity_map.get_token(key=self.token.key)
+            self.assertIs(identity_map.get_user(pk=self.user.pk), token.user)
+        with self.assertNumQueries(0):
+            self.assertIs(identity_map.get_token(user=token.user), token)
+
+    def test_saved_instance_replaces_the_cached_one(self):
+        token = identity_map.get_token(key=self.token.key)
+        other = User.objects.get(pk=self.user.pk)
+        other.first_name = 'John'
+        other.save()
+
+        with self.assertNumQueries(0):
+            self.assertIs(identity_map.get_user(pk=self.user.pk), other)
+            self.assertIs(token.user, other)
+
+    def test_changed_email_is_not_found_by_the_old_one(self):
+        user = identity_map.get_user(email='john@example.com')
+        user.email = 'jane@example.com'
+        user.save()
+
+        with self.assertNumQueries(0):
+            self.assertIs(identity_map.get_user(email='jane@example.com'), user)
+        with self.assertRaises(User.DoesNotExist):
+            identity_map.get_user(email='john@example.com')
+
+    def test_deleted_tokens_are_forgotten(self):
+        identity_map.get_token(key=self.token.key)
+        identity_map.delete_tokens(self.user)
+
+        with self.assertRaises(Token.DoesNotExist):
+            identity_map.get_token(key=self.token.key)
+        with self.assertRaises(Token.DoesNotExist):
+            identity_map.get_token(user=self.user)
+
+    def test_deleted_user_is_forgotten(self):
+        token = identity_map.get_token(key=self.token.key)
+        token.user.delete()
+
+        with self.assertRaises(User.DoesNotExist):
+            identity_map.get_user(pk=self.user.pk)
+        with self.assertRaises(User.DoesNotExist):
+            identity_map.get_user(email='john@example.com')
+        # deleted by the cascade
+        with self.assertRaises(Token.DoesNotExist):
+            identity_map.get_token(key=self.token.key)
+        with self.assertRaises(Token.DoesNotExist):
+            identity_map.get_token(user=self.user)
+
+
+class AuthLogTest(UsersTestCase):
+    def read_log(self):
+        auth_log.log.flush()
+        paths = auth_log.iter_files(auth_log.log.directory)
+        return [json.loads(line) for path in paths for line in path.read_text().splitlines()]
+
+    def test_failed_signin_with_a_json_list_is_a_bad_request(self):
+        response = self.client.post(reverse('signin'), '[1, 2]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIsNone(self.read_log()[-1]['email'])
+
+    def test_failed_signin_email_is_truncated(self):
+        self.client.post(reverse('signin'), {'email': 'x' * 10_000, 'password': PASSWORD})
+        record = self.read_log()[-1]
+        self.assertEqual(record['e'], auth_log.SIGNIN_FAILED)
+        self.assertEqual(len(record['email']), User._meta.get_field('email').max_length)
+
+    def test_events_are_written_after_the_flush_interval_without_other_events(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = auth_log.AuthEventLog(directory, batch_size=1000, flush_interval=0.05)
+            log.append(auth_log.SIGNIN_FAILED, email='john@example.com')
+            time.sleep(0.5)
+            self.assertEqual(len(auth_log.iter_files(directory)), 1)
+
+
+@override_settings(USER_SHARDS=['users_0', 'users_1'])
+class ShardingTest(UsersTestCase):
+    databases = {'default', 'users_0', 'users_1', 'users_2'}
+
+    def emails(self, count, shards=('users_0', 'users_1')):
+        """
+        Return `count` emails of each of the shards.
+        """
+        emails = {shard: [] for shard in shards}
+        for i in range(1000):
+            email = f'user{i}@example.com'
+            shard = sharding.shard_for_email(email)
+            if len(emails.get(shard, [])) < count:
+                emails[shard].append(email)
+        return emails
+
+    def assertOnlyOn(self, shard, model, **lookup):
+        for database in self.databases:
+            self.assertEqual(model.objects.using(database).filter(**lookup).exists(), database == shard, database)
+
+    def test_signup_places_the_user_and_its_token_on_the_shard_of_its_email(self):
+        for shard, emails in self.emails(2).items():
+            for email in emails:
+                data = {'email': email, 'password': PASSWORD, 'confirm_password': PASSWORD}
+                self.assertEqual(self.client.post(reverse('signup'), data).status_code, 201)
+
+                user = User.objects.using(shard).get(email=email)
+                self.assertOnlyOn(shard, User, email=email)
+                self.assertOnlyOn(shard, Token, user_id=user.pk)
+                self.assertEqual(sharding.shard_for_token_key(Token.objects.using(shard).get(user=user).key), shard)
+
+    def test_authenticate_and_token_auth(self):
+        for shard, emails in self.emails(1).items():
+            self.create_user(emails[0])
+
+            user = authenticate(username=emails[0], password=PASSWORD)
+            self.assertEqual(user._state.db, shard)
+
+            response = self.client.post(reverse('signin'), {'email': emails[0], 'password': PASSWORD})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(reverse('me'), HTTP_AUTHORIZATION=f'Token {response.data["token"]}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['email'], emails[0])
+
+    def test_change_of_email_to_another_shard(self):
+        emails = self.emails(1)
+        user = self.create_user(emails['users_0'][0])
+        headers = self.auth(user)
+
+        response = self.client.post(
+            reverse('change_email'), {'email': emails['users_1'][0], 'password': PASSWORD}, **headers
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertOnlyOn('users_1', User, pk=user.pk)
+        self.assertEqual(User.objects.using('users_1').get(pk=user.pk).email, emails['users_1'][0])
+        self.assertEqual(authenticate(username=emails['users_1'][0], password=PASSWORD).pk, user.pk)
+
+        # the old token is gone, the one returned by the change works
+        self.assertEqual(self.client.get(reverse('me'), **headers).status_code, 401)
+        response = self.client.get(reverse('me'), HTTP_AUTHORIZATION=f'Token {response.data["token"]}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_moved_user_stays_in_the_identity_map(self):
+        emails = self.emails(1)
+        self.create_user(emails['users_0'][0])
+        context = identity_map.activate()
+        self.addCleanup(identity_map.deactivate, context)
+
+        user = identity_map.get_user(email=emails['users_0'][0])
+        user.email = emails['users_1'][0]
+        sharding.save_user(user)
+
+        # the delete of the copy left on `users_0` doesn't evict the user saved on `users_1`
+        with self.assertNumQueries(0, using='users_1'):
+            self.assertIs(identity_map.get_user(pk=user.pk), user)
+            self.assertIs(identity_map.get_user(email=emails['users_1'][0]), user)
+
+    def test_rebalance_after_adding_a_shard(self):
+        tokens = {}
+        for emails in self.emails(10).values():
+            for email in emails:
+                user = self.create_user(email)
+                tokens[email] = Token.objects.db_manager(hints={'instance': user}).create(user=user).key
+
+        with self.settings(USER_SHARDS=['users_0', 'users_1', 'users_2']):
+            call_command('rebalance_users', stdout=io.StringIO())
+
+            moved = 0
+            for email, key in tokens.items():
+                shard = sharding.shard_for_email(email)
+                self.assertOnlyOn(shard, User, email=email)
+                self.assertEqual(authenticate(username=email, password=PASSWORD)._state.db, shard)
+
+                # the tokens of the users that didn't move keep working
+                response = self.client.get(reverse('me'), HTTP_AUTHORIZATION=f'Token {key}')
+                if shard == 'users_2':
+                    moved += 1
+                    self.assertEqual(response.status_code, 401)
+                else:
+                    self.assertEqual(response.status_code, 200)
+
+            self.assertGreater(moved, 0)
+
+    def test_user_ids_are_exact_in_javascript(self):
+        for shard, emails in self.emails(1).items():
+            data = {'email': emails[0], 'password': PASSWORD, 'confirm_password': PASSWORD}
+            self.client.post(reverse('signup'), data)
+            self.assertLess(User.objects.using(shard).get(email=emails[0]).pk, 2 ** 53)
+
+        # the last millisecond of the id range
+        last = (sharding.ID_EPOCH_MS + 2 ** sharding.ID_TIME_BITS - 1) / 1000
+        with mock.patch.object(sharding.time, 'time', return_value=last):
+            self.assertLess(sharding.generate_user_id(), 2 ** 53)
+
+
+class MeTest(UsersTestCase):
+    def setUp(self):
+        self.user = self.create_user()
+        self.headers = self.auth(self.user)
+
+    def get(self, **headers):
+        return self.client.get(reverse('me'), **self.headers, **headers)
+
+    def test_not_modified_costs_only_the_authentication(self):
+        etag = self.get()['ETag']
+
+        # token joined with its user
+        with self.assertNumQueries(1):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+    def test_changes_make_a_new_etag(self):
+        etag = self.get()['ETag']
+        self.client.post(reverse('change_email'), {'email': 'jane@example.com', 'password': PASSWORD}, **self.headers)
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['email'], 'jane@example.com')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_partial_save_of_a_public_field_bumps_the_version(self):
+        version = self.user.version
+        self.user.first_name = 'John'
+        self.user.save(update_fields=['first_name'])
+        self.assertEqual(self.user.version, version + 1)
+
+    def test_partial_save_of_a_private_field_keeps_the_version(self):
+        version = self.user.version
+        update_last_login(None, self.user)
+        self.assertEqual(User.objects.get(pk=self.user.pk).version, version)
+
+    def test_concurrent_saves_write_different_versions(self):
+        first, second = User.objects.get(pk=self.user.pk), User.objects.get(pk=self.user.pk)
+        first.first_name, second.last_name = 'John', 'Doe'
+        first.save()
+        second.save()
+        self.assertEqual(second.version, self.user.version + 2)
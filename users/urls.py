@@ -10,4 +10,5 @@ urlpatterns = [
     path('password_reset/<str:token>', views.PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
     path('change_password/', views.ChangePasswordView.as_view(), name='change_password'),
     path('change_email/', views.ChangeEmailView.as_view(), name='change_email'),
+    path('me/', views.MeView.as_view(), name='me'),
 ]
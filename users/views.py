@@ -1,4 +1,8 @@
+from collections.abc import Mapping
+
 from django.contrib.auth.models import update_last_login
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.generics import GenericAPIView, CreateAPIView
@@ -6,7 +10,7 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from . import serializers, email
+from . import serializers, email, identity_map, auth_log, sharding
 
 
 class SigninView(GenericAPIView):
@@ -37,12 +41,16 @@ class SigninView(GenericAPIView):
             user = serializer.validated_data['user']
 
             # this line of code will resolve Token error for superuser:
-            token, _ = Token.objects.get_or_create(user=user)
+            # (the `instance` hint routes the query to the database of the user, see `users/sharding.py`)
+            token, _ = Token.objects.db_manager(hints={'instance': user}).get_or_create(user=user)
 
             update_last_login(None, user)
+            auth_log.record(auth_log.SIGNIN, request, user=user)
 
             return Response({'token': token.key}, status=status.HTTP_200_OK)
         else:
+            email_used = request.data.get('email') if isinstance(request.data, Mapping) else None
+            auth_log.record(auth_log.SIGNIN_FAILED, request, email=email_used)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -57,10 +65,11 @@ class SignupView(CreateAPIView):
             user = serializer.save(is_active=False)
 
             # Generate a unique token for the user
-            token = Token.objects.get_or_create(user=user)
+            token = Token.objects.db_manager(hints={'instance': user}).get_or_create(user=user)
 
             # Send confirmation email
             email.SendEmail.send_signup_confirmation(request, user, token)
+            auth_log.record(auth_log.SIGNUP, request, user=user)
 
             return Response(
                 {'Confirm email': 'Please check your email to confirm your address'},
@@ -73,7 +82,7 @@ class SignupView(CreateAPIView):
 class ConfirmSignupView(GenericAPIView):
     def get(self, request, token):
         try:
-            user = Token.objects.get(key=token).user
+            user = identity_map.get_token(key=token).user
         except Token.DoesNotExist:
             return Response({'message': 'Invalid token.'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -83,6 +92,7 @@ class ConfirmSignupView(GenericAPIView):
         # Activate the user, email is confirmed
         user.is_active = True
         user.save()
+        auth_log.record(auth_log.SIGNUP_CONFIRM, request, user=user)
 
         return Response({'message': 'Account activated successfully.'}, status=status.HTTP_200_OK)
 
@@ -111,7 +121,7 @@ class LogoutView(APIView):
         If the user was not authenticated, we return an error message with a `400 status code`.
         """
         try:
-            Token.objects.filter(user=request.user).delete()
+            identity_map.delete_tokens(request.user)
             return Response({"message": "You have been logged out."}, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -128,12 +138,13 @@ class PasswordResetView(GenericAPIView):
         user = serializer.validated_data['user']
 
         # Delete any existing tokens for the user
-        Token.objects.filter(user=user).delete()
+        identity_map.delete_tokens(user)
         # Create a new token for the user
-        token = Token.objects.create(user=user)
+        token = Token.objects.db_manager(hints={'instance': user}).create(user=user)
 
         # Send password reset email
         email.SendEmail.send_password_reset(request, user, token)
+        auth_log.record(auth_log.PASSWORD_RESET, request, user=user)
 
         return Response({'detail': 'Password reset email sent.'}, status=status.HTTP_200_OK)
 
@@ -144,7 +155,8 @@ class PasswordResetConfirmView(GenericAPIView):
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={'token': kwargs.get('token')})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        user = serializer.save()
+        auth_log.record(auth_log.PASSWORD_RESET_CONFIRM, request, user=user)
 
         return Response({'detail': 'Password has been reset.'}, status=status.HTTP_200_OK)
 
@@ -159,6 +171,7 @@ class ChangePasswordView(GenericAPIView):
         serializer.is_valid(raise_exception=True)
         user.set_password(serializer.validated_data)
         user.save()
+        auth_log.record(auth_log.PASSWORD_CHANGE, request, user=user)
 
         # send mail
         email.SendEmail.send_change_password(user)
@@ -175,9 +188,44 @@ class ChangeEmailView(APIView):
         serializer = self.serializer_class(data=request.data, context={'user': user})
         serializer.is_valid(raise_exception=True)
         user.email = serializer.validated_data
-        user.save()
+
+        # the new email may belong to another shard, the user is then moved there and its token gets a new key
+        token = sharding.save_user(user)
+        auth_log.record(auth_log.EMAIL_CHANGE, request, user=user)
 
         # send email
         email.SendEmail.send_change_email(user.email)
 
+        if token is not None:
+            return Response({'detail': 'Email changed successfully', 'token': token.key}, status=status.HTTP_200_OK)
         return Response({'detail': 'Email changed successfully'}, status=status.HTTP_200_OK)
+
+
+class MeView(GenericAPIView):
+    """
+    Returns the public fields of the signed-in user.
+
+    Clients that poll this endpoint should send back the `ETag` of the last response in an `If-None-Match` header:
+    as long as the user hasn't changed, the answer is an empty `304 Not Modified`. The ETag is the version of the user
+    (bumped by every save, see `User.version`), which is loaded with the token during authentication, so a `304` costs
+    no query besides the authentication and no serialization.
+    """
+    serializer_class = serializers.UserSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        user = request.user
+        etag = quote_etag(f'{user.pk}-{user.version}')
+
+        # weak comparison, as for any `If-None-Match` (proxies that compress responses make ETags weak)
+        if_none_match = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(self.get_serializer(user).data, status=status.HTTP_200_OK)
+
+        # the response depends on the token, shared caches must not store it
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        patch_vary_headers(response, ('Authorization',))
+        return response